@@ -1,5 +1,8 @@
 from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import orjson
+import math
 import os
 from predictor import HMPIPredictor
 import traceback
@@ -10,20 +13,39 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, '..', 'templates')  # parent folder
 STATIC_DIR = os.path.join(BASE_DIR, '..', 'assets')      # parent folder
 
+class OrjsonProvider(JSONProvider):
+    """Routes jsonify() and request.get_json() through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for all routes
-app.secret_key = "supersecretkey"
+# SECRET_KEY signs the login session cookie. It must be set when served by
+# gunicorn; only `python app.py` (local development) may fall back to a
+# fixed, publicly known key.
+app.secret_key = os.environ.get("SECRET_KEY")
+if not app.secret_key:
+    if __name__ != '__main__':
+        raise RuntimeError("SECRET_KEY is not set; refusing to start with an insecure session key")
+    print("⚠️ SECRET_KEY not set; using the insecure development key. Never do this in production.")
+    app.secret_key = "supersecretkey"
 
 # -----------------------------
 # Load Predictor Pipeline
 # -----------------------------
 MODEL_FILE = os.path.join(BASE_DIR, 'model', 'hmpi_predictor_model.pkl')
 COLUMNS_FILE = os.path.join(BASE_DIR, 'model', 'model_feature_columns.pkl')
+COMPILED_FILE = os.path.join(BASE_DIR, 'model', 'hmpi_rf.so')  # optional, see train_model.py
 
 try:
     if not os.path.exists(MODEL_FILE) or not os.path.exists(COLUMNS_FILE):
         raise FileNotFoundError("Model or columns file not found!")
-    predictor = HMPIPredictor(MODEL_FILE, COLUMNS_FILE)
+    predictor = HMPIPredictor(MODEL_FILE, COLUMNS_FILE, compiled_path=COMPILED_FILE)
     print("✅ Predictor pipeline loaded successfully.")
 except Exception as e:
     print(f"❌ Detailed error loading predictor:")
@@ -32,6 +54,24 @@ except Exception as e:
 # -----------------------------
 # Login + HTML Routes
 # -----------------------------
+# Pages that need a logged-in user; checked once in require_login()
+PROTECTED_ENDPOINTS = frozenset({"route_dashboard", "route_analytics", "route_admin", "route_station"})
+
+@app.before_request
+def require_login():
+    if request.endpoint in PROTECTED_ENDPOINTS and "user" not in session:
+        return redirect(url_for("route_index"))
+
+# These pages take no per-request template variables, so each one is
+# rendered on its first hit and the HTML is reused afterwards
+_rendered_pages = {}
+
+def render_static_page(name):
+    html = _rendered_pages.get(name)
+    if html is None or app.debug:  # re-render in debug so template edits show up
+        html = _rendered_pages[name] = render_template(name)
+    return html
+
 @app.route('/', methods=['GET', 'POST'])
 def route_index():
     if request.method == 'POST':
@@ -44,31 +84,23 @@ def route_index():
         else:
             return render_template("index.html", error="❌ Invalid credentials")
 
-    return render_template("index.html")
+    return render_static_page("index.html")
 
 @app.route('/dashboard')
 def route_dashboard():
-    if "user" not in session:
-        return redirect(url_for("route_index"))
-    return render_template('dataentry.html')
+    return render_static_page('dataentry.html')
 
 @app.route('/analytics')
 def route_analytics():
-    if "user" not in session:
-        return redirect(url_for("route_index"))
-    return render_template('analytics.html')
+    return render_static_page('analytics.html')
 
 @app.route('/admin')
 def route_admin():
-    if "user" not in session:
-        return redirect(url_for("route_index"))
-    return render_template('admin.html')
+    return render_static_page('admin.html')
 
 @app.route('/station')
 def route_station():
-    if "user" not in session:
-        return redirect(url_for("route_index"))
-    return render_template('station.html')
+    return render_static_page('station.html')
 
 @app.route('/logout')
 def logout():
@@ -82,14 +114,26 @@ def logout():
 def predict_hmpi():
     if predictor is None:
         return jsonify({'error': 'Predictor pipeline not available on server.'}), 500
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Missing latitude or longitude in request.'}), 400
+    try:
+        raw_lat = data["latitude"]
+        raw_lon = data["longitude"]
+    except KeyError:
+        return jsonify({'error': 'Missing latitude or longitude in request.'}), 400
+    try:
+        # float(True) would quietly pass as 1.0
+        if isinstance(raw_lat, bool) or isinstance(raw_lon, bool):
+            raise TypeError
+        lat = float(raw_lat)
+        lon = float(raw_lon)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Latitude and longitude must be numbers.'}), 400
+    if not (math.isfinite(lat) and math.isfinite(lon)) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({'error': 'Latitude must be within [-90, 90] and longitude within [-180, 180].'}), 400
+
     try:
-        data = request.get_json()
-        if not data or "latitude" not in data or "longitude" not in data:
-            return jsonify({'error': 'Missing latitude or longitude in request.'}), 400
-        
-        lat = float(data["latitude"])
-        lon = float(data["longitude"])
-        
         predicted_hmpi = predictor.get_prediction(lat, lon)
         
         # --- FIX: Added 'critical_factor' to the response ---
@@ -109,6 +153,7 @@ def predict_hmpi():
 # -----------------------------
 # Main Execution
 # -----------------------------
+# Local development only; production is served by gunicorn (see gunicorn.conf.py).
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     print(f"🚀 Starting Flask app on port {port}")
@@ -0,0 +1,60 @@
+# ===================================================================
+# OSM Feature Extracts for the HMPI Predictor (one-off)
+# Description: Scans an India OpenStreetMap extract once and saves the
+#              centre points of the four feature classes used for the
+#              distance features, so predictor.py can answer
+#              nearest-distance queries locally instead of calling
+#              the Overpass API on every prediction.
+# Usage:       Download https://download.geofabrik.de/asia/india-latest.osm.pbf
+#              then run: python build_osm_extracts.py [path/to/india-latest.osm.pbf]
+# Requires:    pip install osmium   (only for this script)
+# ===================================================================
+
+import os
+import sys
+import numpy as np
+import osmium
+from osm_features import FEATURE_FILTERS
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+pbf_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, 'data', 'india-latest.osm.pbf')
+output_path = os.path.join(script_dir, 'data', 'osm_features.npz')
+
+
+class WayCentreHandler(osmium.SimpleHandler):
+    """Collects the bounding-box centre of every matching way, like Overpass `out center`."""
+
+    def __init__(self):
+        super().__init__()
+        self.points = {key: [] for key in FEATURE_FILTERS}
+
+    def way(self, w):
+        keys = [key for key, matches in FEATURE_FILTERS.items() if matches(w.tags)]
+        if not keys:
+            return
+        try:
+            lats = [n.lat for n in w.nodes]
+            lons = [n.lon for n in w.nodes]
+        except osmium.InvalidLocationError:
+            return  # way references nodes outside the extract
+        centre = ((min(lats) + max(lats)) / 2, (min(lons) + max(lons)) / 2)
+        for key in keys:
+            self.points[key].append(centre)
+
+
+if __name__ == "__main__":
+    if not os.path.exists(pbf_path):
+        print(f"❌ Error: OSM extract not found at {pbf_path}")
+        sys.exit(1)
+
+    print(f"⏳ Scanning {pbf_path} (this takes a while for all of India)...")
+    handler = WayCentreHandler()
+    handler.apply_file(pbf_path, locations=True)
+
+    arrays = {key: np.array(points, dtype=np.float64).reshape(-1, 2) for key, points in handler.points.items()}
+    for key, arr in arrays.items():
+        print(f"  - {key}: {arr.shape[0]} features")
+
+    # Each array is (N, 2) of (lat, lon)
+    np.savez_compressed(output_path, **arrays)
+    print(f"✅ Extracts saved successfully at: {output_path}")
@@ -0,0 +1,17 @@
+# ===================================================================
+# Gunicorn settings (picked up automatically from the working directory)
+# ===================================================================
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+
+# Threads overlap the blocking upstream HTTP calls made per prediction
+worker_class = "gthread"
+threads = 8
+
+# Import app.py (and so load HMPIPredictor) once in the master before
+# forking. Workers then start from the master's already-loaded forest and
+# share its heap pages copy-on-write (until a page is written), instead of
+# each loading the pickle from disk again.
+preload_app = True
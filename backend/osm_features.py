@@ -0,0 +1,34 @@
+# ===================================================================
+# OSM Feature Classes behind the Distance Features
+# Description: Single definition of which OpenStreetMap ways count for each
+#              dist_to_nearest_* feature. Used both by predictor.py (live
+#              Overpass download) and build_osm_extracts.py (offline PBF
+#              extract), so the two sources always select the same ways.
+#              Standard library only, so either side can import it.
+# ===================================================================
+
+import re
+
+# Tag test per distance feature. The highway filter is an unanchored regex,
+# as in OVERPASS_QUERY, so *_link roads are included.
+FEATURE_FILTERS = {
+    "dist_to_nearest_industrial_area_km": lambda tags: tags.get("landuse") == "industrial",
+    "dist_to_nearest_drain_outfall_km": lambda tags: tags.get("waterway") == "drain",
+    "dist_to_nearest_landfill_km": lambda tags: tags.get("landuse") == "landfill",
+    "dist_to_nearest_major_highway_km": lambda tags: re.search("motorway|trunk|primary", tags.get("highway", "")) is not None,
+}
+
+# Overpass query returning every way matched by FEATURE_FILTERS in India;
+# the India area is resolved once and elements are split by their tags.
+OVERPASS_TIMEOUT = 60  # seconds
+OVERPASS_QUERY = f"""
+    [out:json][timeout:{OVERPASS_TIMEOUT}];
+    area["ISO3166-1"="IN"][admin_level=2]->.in;
+    (
+        way["landuse"="industrial"](area.in);
+        way["waterway"="drain"](area.in);
+        way["landuse"="landfill"](area.in);
+        way["highway"~"motorway|trunk|primary"](area.in);
+    );
+    out tags center;
+"""
@@ -3,11 +3,24 @@
 # Author: Rishi + Updated to Class-based OOP
 # ===================================================================
 
+from concurrent.futures import ThreadPoolExecutor, wait
+import functools
+import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import joblib
-import pandas as pd
-from shapely.geometry import Point
+import numpy as np
+import orjson
 import rasterio
+import shapely
+from osm_features import FEATURE_FILTERS as OVERPASS_FILTERS, OVERPASS_QUERY, OVERPASS_TIMEOUT
+
+try:
+    import tl2cgen  # optional: compiled tree inference
+except ImportError:
+    tl2cgen = None
 
 # -------------------------------
 # Default fallback values (approx from India dataset)
@@ -24,99 +37,342 @@ DEFAULTS = {
     "soil_type_clay": 1
 }
 
+# -------------------------------
+# Concurrent fetching
+# -------------------------------
+# The lookups are independent blocking I/O, so they run side by side and a
+# prediction costs the slowest lookup instead of the sum of all of them. The
+# pool is shared by every request thread in the worker; its threads are only
+# started on first submit, i.e. after gunicorn has forked.
+FETCH_TIMEOUT = 15  # seconds a prediction waits for the lookups, matching the longest per-request read timeout below
+FETCH_WORKERS = 32
+_EXECUTOR = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="hmpi-fetch")
+
+# Caps lookups running or queued on the pool. When upstreams hang, new
+# requests fall back to DEFAULTS immediately instead of piling work up
+# behind the stuck calls.
+FETCH_QUEUE_LIMIT = 2 * FETCH_WORKERS
+_FETCH_SLOTS = threading.BoundedSemaphore(FETCH_QUEUE_LIMIT)
+
+def _submit(fn, *args):
+    """Submits fn to the fetch pool, or returns None if the pool is saturated."""
+    if not _FETCH_SLOTS.acquire(blocking=False):
+        return None
+    future = _EXECUTOR.submit(fn, *args)
+    future.add_done_callback(lambda _: _FETCH_SLOTS.release())
+    return future
+
+# One pooled session for all upstream APIs, so repeat calls to the same host
+# reuse a kept-alive connection instead of a new TCP/TLS handshake each time.
+# Only connection errors are retried: a retry after a read timeout would
+# finish after build_features has stopped waiting, and would just hold a
+# fetch thread that later requests need.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=FETCH_WORKERS,
+    max_retries=Retry(total=2, read=0, backoff_factor=0.2),
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+# -------------------------------
+# Per-location caching
+# -------------------------------
+# The looked-up values are effectively static for a given place, so results
+# are memoized in-process on coordinates rounded to ~100 m.
+COORD_DECIMALS = 3
+CACHE_SIZE = 100_000
+
+def _coord_cache(fetch):
+    """Memoizes fetch(lat, lon, *args) on lat/lon rounded to COORD_DECIMALS.
+
+    Only successful lookups are cached: the wrapped function raises on
+    failure, so a transient upstream error is retried on the next request.
+    """
+    cached = functools.lru_cache(maxsize=CACHE_SIZE)(fetch)
+
+    @functools.wraps(fetch)
+    def wrapper(lat, lon, *args):
+        return cached(round(lat, COORD_DECIMALS), round(lon, COORD_DECIMALS), *args)
+
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
 # -------------------------------
 # Utility Functions (internal)
 # -------------------------------
-def _get_nearest_distance(lat, lon, query, fallback_key):
+EARTH_RADIUS_KM = 6371.0
+
+def _haversine_km(lat, lon, lats, lons):
+    """Great-circle distances (km) from one point to arrays of points."""
+    lat_r = np.radians(lat)
+    lats_r = np.radians(lats)
+    dlat = lats_r - lat_r
+    dlon = np.radians(lons - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_r) * np.cos(lats_r) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def _element_coords(elements):
+    """Splits Overpass elements into lat/lon arrays.
+
+    Nodes carry lat/lon directly; ways requested with `out center` carry
+    them under "center".
+    """
+    points = [elem.get("center", elem) for elem in elements]
+    points = [p for p in points if "lat" in p and "lon" in p]
+    lats = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=len(points))
+    lons = np.fromiter((p["lon"] for p in points), dtype=np.float64, count=len(points))
+    return lats, lons
+
+# -------------------------------
+# Nearest-feature indexes (local extracts or a cached Overpass download)
+# -------------------------------
+KM_PER_DEG = 110.0  # lower bound over latitudes, so search boxes never come up short
+
+def _index_points(lats, lons):
+    return (shapely.STRtree(shapely.points(lons, lats)), lats, lons)
+
+# {feature key: index} once the Overpass download has succeeded. OVERPASS_QUERY
+# doesn't depend on the location asked about, so it is downloaded once per
+# process in the background and may take longer than a request.
+_overpass_indexes = None
+_OVERPASS_LOCK = threading.Lock()
+
+def _fetch_overpass_indexes():
+    """Downloads the India-wide feature classes once and indexes them.
+
+    Only one thread downloads at a time; others fail fast instead of piling
+    up on Overpass. Failures aren't kept, so a later request tries again.
+    """
+    global _overpass_indexes
+    if not _OVERPASS_LOCK.acquire(blocking=False):
+        raise LookupError("Overpass download already in progress")
     try:
-        url = "http://overpass-api.de/api/interpreter"
-        r = requests.get(url, params={"data": query}, timeout=15)
-        data = r.json()
-        coords = []
-        for elem in data.get("elements", []):
-            if "lat" in elem and "lon" in elem:
-                coords.append((elem["lat"], elem["lon"]))
-        if not coords:
-            return DEFAULTS[fallback_key]
-        user_point = Point(lon, lat)
-        distances = [user_point.distance(Point(lon2, lat2)) * 111 for lat2, lon2 in coords]
-        return min(distances)
+        if _overpass_indexes is None:
+            url = "http://overpass-api.de/api/interpreter"
+            r = _SESSION.get(url, params={"data": OVERPASS_QUERY}, timeout=OVERPASS_TIMEOUT)
+            # Overpass responses for all of India run to megabytes; orjson decodes
+            # them several times faster than the stdlib json behind r.json()
+            data = orjson.loads(r.content)
+            buckets = {key: [] for key in OVERPASS_FILTERS}
+            for elem in data.get("elements", []):
+                tags = elem.get("tags", {})
+                for key, matches in OVERPASS_FILTERS.items():
+                    if matches(tags):
+                        buckets[key].append(elem)
+            indexes = {}
+            for key, elements in buckets.items():
+                lats, lons = _element_coords(elements)
+                if lats.size:
+                    indexes[key] = _index_points(lats, lons)
+            if not indexes:
+                raise LookupError("Overpass returned no coordinates")
+            _overpass_indexes = indexes
+        return _overpass_indexes
+    finally:
+        _OVERPASS_LOCK.release()
+
+def _load_osm_indexes(extracts_path):
+    """Builds an STRtree per distance feature from the saved (lat, lon) extracts.
+
+    Features missing from the file (or a missing file) simply get no index
+    and keep using Overpass.
+    """
+    if extracts_path is None or not os.path.exists(extracts_path):
+        return {}
+    indexes = {}
+    with np.load(extracts_path) as extracts:
+        for key in OVERPASS_FILTERS:
+            if key not in extracts.files or extracts[key].shape[0] == 0:
+                continue
+            indexes[key] = _index_points(extracts[key][:, 0], extracts[key][:, 1])
+    return indexes
+
+def _local_nearest_distance(index, lat, lon):
+    """Great-circle distance (km) to the nearest indexed feature.
+
+    The tree's nearest point is nearest in planar lon/lat degrees, not on the
+    ground, so it only bounds the search: all points in a lon/lat box of that
+    radius are re-checked with Haversine.
+    """
+    tree, lats, lons = index
+    nearest = tree.nearest(shapely.Point(lon, lat))
+    bound_km = _haversine_km(lat, lon, lats[nearest], lons[nearest])
+    dlat = bound_km / KM_PER_DEG
+    dlon = bound_km / (KM_PER_DEG * max(np.cos(np.radians(lat)), 1e-6))
+    candidates = tree.query(shapely.box(lon - dlon, lat - dlat, lon + dlon, lat + dlat))
+    return float(_haversine_km(lat, lon, lats[candidates], lons[candidates]).min())
+
+def _get_nearest_distance(indexes, lat, lon, key):
+    index = indexes.get(key)
+    if index is None:
+        return DEFAULTS[key]
+    try:
+        return _local_nearest_distance(index, lat, lon)
     except Exception:
-        return DEFAULTS[fallback_key]
+        return DEFAULTS[key]
+
+@_coord_cache
+def _fetch_elevation(lat, lon):
+    url = f"https://api.open-elevation.com/api/v1/lookup?locations={lat},{lon}"
+    r = _SESSION.get(url, timeout=10).json()
+    return r['results'][0]['elevation']
 
 def _get_elevation(lat, lon):
     try:
-        url = f"https://api.open-elevation.com/api/v1/lookup?locations={lat},{lon}"
-        r = requests.get(url, timeout=10).json()
-        return r['results'][0]['elevation']
+        return _fetch_elevation(lat, lon)
     except Exception:
         return DEFAULTS["elevation_m"]
 
+@_coord_cache
+def _fetch_rainfall(lat, lon):
+    url = f"https://power.larc.nasa.gov/api/temporal/climatology/point?parameters=PRECTOT&community=AG&longitude={lon}&latitude={lat}&format=JSON"
+    r = _SESSION.get(url, timeout=15).json()
+    return r['properties']['parameter']['PRECTOT']['ANN']
+
 def _get_rainfall(lat, lon):
     try:
-        url = f"https://power.larc.nasa.gov/api/temporal/climatology/point?parameters=PRECTOT&community=AG&longitude={lon}&latitude={lat}&format=JSON"
-        r = requests.get(url, timeout=15).json()
-        return r['properties']['parameter']['PRECTOT']['ANN']
+        return _fetch_rainfall(lat, lon)
     except Exception:
         return DEFAULTS["annual_precip_mm"]
 
-def _get_population_density(lat, lon, raster_path="data/worldpop_density.tif"):
-    try:
-        with rasterio.open(raster_path) as src:
-            for val in src.sample([(lon, lat)]):
-                return float(val[0])
-    except Exception:
-        return DEFAULTS["population_density_per_km2"]
-
 # -------------------------------
 # Class-based Predictor
 # -------------------------------
+DEFAULT_RASTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "worldpop_density.tif")
+DEFAULT_EXTRACTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "osm_features.npz")
+
 class HMPIPredictor:
-    def __init__(self, model_path, columns_path):
+    def __init__(self, model_path, columns_path, raster_path=DEFAULT_RASTER_PATH, compiled_path=None,
+                 extracts_path=DEFAULT_EXTRACTS_PATH):
         self.model = joblib.load(model_path)
+        self._compiled = self._load_compiled(compiled_path)
         self.feature_columns = joblib.load(columns_path)
-
-    def build_features(self, lat, lon):
-        features = {
-            "latitude": lat,
-            "longitude": lon,
-            "dist_to_nearest_industrial_area_km": _get_nearest_distance(lat, lon, """
-                area["ISO3166-1"="IN"][admin_level=2];
-                (way["landuse"="industrial"](area););
-                out center;
-            """, "dist_to_nearest_industrial_area_km"),
-            "dist_to_nearest_drain_outfall_km": _get_nearest_distance(lat, lon, """
-                area["ISO3166-1"="IN"][admin_level=2];
-                (way["waterway"="drain"](area););
-                out center;
-            """, "dist_to_nearest_drain_outfall_km"),
-            "dist_to_nearest_landfill_km": _get_nearest_distance(lat, lon, """
-                area["ISO3166-1"="IN"][admin_level=2];
-                (way["landuse"="landfill"](area););
-                out center;
-            """, "dist_to_nearest_landfill_km"),
-            "dist_to_nearest_major_highway_km": _get_nearest_distance(lat, lon, """
-                area["ISO3166-1"="IN"][admin_level=2];
-                (way["highway"~"motorway|trunk|primary"](area););
-                out center;
-            """, "dist_to_nearest_major_highway_km"),
-            "annual_precip_mm": _get_rainfall(lat, lon),
-            "population_density_per_km2": _get_population_density(lat, lon),
-            "elevation_m": _get_elevation(lat, lon),
+        # Models fitted on a DataFrame remember their column names and warn on
+        # every ndarray predict. Check once that they match the columns file
+        # (i.e. model and columns belong together), then drop them.
+        if hasattr(self.model, "feature_names_in_"):
+            if list(self.model.feature_names_in_) != list(self.feature_columns):
+                raise ValueError(f"Model at {model_path} was trained on different columns than {columns_path}")
+            del self.model.feature_names_in_
+        # Column name -> position in the model's input vector
+        self._col_index = {name: i for i, name in enumerate(self.feature_columns)}
+        # Features that never change per location, encoded once
+        self._base_row = self._vectorize({
             "land_use_category_estuary": DEFAULTS["land_use_category_estuary"],
             "soil_type_clay": DEFAULTS["soil_type_clay"]
+        })
+        self._raster_path = self._check_raster(raster_path)
+        # rasterio datasets must not be shared between threads (or across the
+        # gunicorn fork), so each request thread lazily opens and keeps its own
+        self._raster_local = threading.local()
+        self._osm_indexes = _load_osm_indexes(extracts_path)
+
+    @staticmethod
+    def _load_compiled(compiled_path):
+        """Loads the forest compiled by train_model.py, if there is one."""
+        if compiled_path is None or tl2cgen is None or not os.path.exists(compiled_path):
+            return None
+        try:
+            return tl2cgen.Predictor(compiled_path, nthread=1)
+        except Exception as e:
+            print(f"⚠️ Compiled model unusable ({e}); falling back to scikit-learn.")
+            return None
+
+    @staticmethod
+    def _check_raster(raster_path):
+        try:
+            with rasterio.open(raster_path):
+                return raster_path
+        except Exception as e:
+            print(f"⚠️ Population raster unavailable ({e}); using default density.")
+            return None
+
+    def _get_population_density(self, lat, lon):
+        if self._raster_path is None:
+            return DEFAULTS["population_density_per_km2"]
+        try:
+            src = getattr(self._raster_local, "dataset", None)
+            if src is None:
+                src = self._raster_local.dataset = rasterio.open(self._raster_path)
+            for val in src.sample([(lon, lat)]):
+                return float(val[0])
+        except Exception:
+            pass
+        return DEFAULTS["population_density_per_km2"]
+
+    def build_features(self, lat, lon):
+        # Only the network lookups go to the pool
+        futures = {
+            "annual_precip_mm": _submit(_get_rainfall, lat, lon),
+            "elevation_m": _submit(_get_elevation, lat, lon),
         }
+        # Distance features without a local extract come from one Overpass
+        # download, made only until it has succeeded once
+        remote_keys = [key for key in OVERPASS_FILTERS if key not in self._osm_indexes]
+        overpass = None
+        if remote_keys and _overpass_indexes is None:
+            overpass = _submit(_fetch_overpass_indexes)
+
+        # Local lookups (STRtree search, one raster pixel) are quick and need
+        # no network, so they run here while the remote ones are in flight
+        features = {"latitude": lat, "longitude": lon}
+        for key in self._osm_indexes:
+            features[key] = _get_nearest_distance(self._osm_indexes, lat, lon, key)
+        features["population_density_per_km2"] = self._get_population_density(lat, lon)
+
+        pending = [f for f in [*futures.values(), overpass] if f is not None]
+        done, not_done = wait(pending, timeout=FETCH_TIMEOUT)
+        # Drop lookups that never started so they don't hold up later
+        # requests; ones already running finish and still fill the cache
+        for future in not_done:
+            future.cancel()
+
+        # Anything skipped, still running or failed falls back like the helpers do
+        def finished(future):
+            return future is not None and future in done and future.exception() is None
+
+        for key, future in futures.items():
+            features[key] = future.result() if finished(future) else DEFAULTS[key]
+        # Once downloaded, Overpass classes are answered from memory like the local extracts
+        overpass_indexes = _overpass_indexes or {}
+        for key in remote_keys:
+            features[key] = _get_nearest_distance(overpass_indexes, lat, lon, key)
+
+        return self._vectorize(features, base=self._base_row)
+
+    def _vectorize(self, features, base=None):
+        """Fills a (1, n_features) row in training column order.
 
-        df = pd.DataFrame([features])
-        # Align with training feature columns
-        for col in self.feature_columns:
-            if col not in df.columns:
-                df[col] = 0
-        return df[self.feature_columns]
+        Starts from a copy of `base` (zeros if not given). Numeric keys land
+        straight in their column; string values are treated as categories and
+        set their one-hot "{key}_{value}" slot. Keys the model was never
+        trained on are ignored.
+        """
+        if base is None:
+            x = np.zeros((1, len(self.feature_columns)), dtype=np.float32)
+        else:
+            x = base.copy()
+        for key, value in features.items():
+            if isinstance(value, str):
+                i = self._col_index.get(f"{key}_{value}")
+                if i is not None:
+                    x[0, i] = 1.0
+            else:
+                i = self._col_index.get(key)
+                if i is not None:
+                    x[0, i] = value
+        return x
 
     def get_prediction(self, lat, lon):
         X = self.build_features(lat, lon)
-        return round(float(self.model.predict(X)[0]), 2)
+        if self._compiled is not None:
+            prediction = self._compiled.predict(tl2cgen.DMatrix(X)).ravel()[0]
+        else:
+            prediction = self.model.predict(X)[0]
+        return round(float(prediction), 2)
 
 
 # -------------------------------
@@ -125,5 +381,6 @@ class HMPIPredictor:
 if __name__ == "__main__":
     MODEL_FILE = "model/hmpi_predictor_model.pkl"
     COLUMNS_FILE = "model/model_feature_columns.pkl"
-    predictor = HMPIPredictor(MODEL_FILE, COLUMNS_FILE)
+    COMPILED_FILE = "model/hmpi_rf.so"
+    predictor = HMPIPredictor(MODEL_FILE, COLUMNS_FILE, compiled_path=COMPILED_FILE)
     print("Predicted HMPI for Delhi:", predictor.get_prediction(28.6, 77.2))